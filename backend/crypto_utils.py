@@ -3,37 +3,163 @@ Módulo Criptográfico - SeguraAssina
 Implementa operações de assinatura digital RSA com SHA-256
 """
 
-import base64
+import functools
 import hashlib
-from Crypto.PublicKey import RSA
-from Crypto.Signature import pkcs1_15
-from Crypto.Hash import SHA256
+import hmac
+import os
+import queue
+import secrets
+import threading
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from typing import BinaryIO
+import cachetools
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding, rsa, utils
 
+# Tamanho dos blocos lidos ao calcular o hash de um stream
+CHUNK_SIZE = 64 * 1024
 
-def generate_rsa_keypair(key_size: int = 2048) -> tuple[str, str]:
+# Abaixo deste número de documentos, hash_many calcula os hashes em série
+HASH_MANY_MIN_BATCH = 4
+
+# Threads para hash_many: o hashlib libera o GIL em entradas grandes,
+# então os hashes de documentos independentes rodam em paralelo
+_hash_executor = ThreadPoolExecutor(max_workers=os.cpu_count())
+
+# Threads para as operações RSA (o OpenSSL libera o GIL durante a
+# exponenciação modular), ver sign_document_async
+_rsa_executor = ThreadPoolExecutor(max_workers=os.cpu_count())
+
+# Resultados de verificações recentes, por (digest, assinatura, chave pública)
+_verify_cache = cachetools.TTLCache(maxsize=4096, ttl=300)
+_verify_cache_lock = threading.RLock()
+
+# Chaves privadas registradas no servidor, referenciadas por key_id
+_private_keys = cachetools.LRUCache(maxsize=128)
+_private_keys_lock = threading.Lock()
+
+# Segredo deste processo para derivar key_ids de chaves enviadas em PEM
+_key_id_secret = secrets.token_bytes(32)
+
+# Chaves RSA pré-geradas por tamanho, reabastecidas em segundo plano
+KEY_POOL_SIZE = 4
+_key_pool = {key_size: queue.Queue(maxsize=KEY_POOL_SIZE) for key_size in (2048, 4096)}
+_key_pool_consumed = threading.Event()
+_key_pool_lock = threading.Lock()
+_key_pool_thread = None
+
+
+@functools.lru_cache(maxsize=128)
+def _load_private(private_key_pem: str) -> rsa.RSAPrivateKey:
+    """
+    Carrega uma chave privada RSA a partir do PEM.
+
+    O resultado é mantido em cache, evitando repetir o parsing e as
+    verificações de consistência da chave a cada assinatura.
+    """
+    try:
+        private_key = serialization.load_pem_private_key(
+            private_key_pem.encode('utf-8'), password=None
+        )
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Chave privada inválida: {e}")
+
+    if not isinstance(private_key, rsa.RSAPrivateKey):
+        raise ValueError("Chave privada inválida: a chave não é RSA")
+
+    return private_key
+
+
+@functools.lru_cache(maxsize=128)
+def _load_public(public_key_pem: str) -> rsa.RSAPublicKey:
+    """
+    Carrega uma chave pública RSA a partir do PEM (com cache).
+    """
+    try:
+        public_key = serialization.load_pem_public_key(public_key_pem.encode('utf-8'))
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Chave pública inválida: {e}")
+
+    if not isinstance(public_key, rsa.RSAPublicKey):
+        raise ValueError("Chave pública inválida: a chave não é RSA")
+
+    return public_key
+
+
+def generate_rsa_keypair(key_size: int = 2048,
+                         register: bool = False) -> tuple[str, str, str | None]:
     """
     Gera par de chaves RSA.
 
     Args:
         key_size: Tamanho da chave em bits (2048 ou 4096)
+        register: Se True, a chave privada também é registrada neste
+            processo (ver register_private_key), de modo que pode ser usada
+            para assinar pelo key_id sem carregar e verificar o PEM
 
     Returns:
-        Tupla (private_key_pem, public_key_pem)
+        Tupla (private_key_pem, public_key_pem, key_id); key_id é None se a
+        chave não foi registrada
     """
     if key_size not in [2048, 4096]:
         raise ValueError("Tamanho de chave deve ser 2048 ou 4096 bits")
 
-    # Gerar par de chaves RSA
-    key = RSA.generate(key_size)
+    # Usar uma chave pré-gerada, se houver; senão gerar na hora
+    try:
+        key = _key_pool[key_size].get_nowait()
+        _key_pool_consumed.set()
+    except queue.Empty:
+        key = rsa.generate_private_key(public_exponent=65537, key_size=key_size)
 
     # Exportar em formato PEM
-    private_key_pem = key.export_key().decode('utf-8')
-    public_key_pem = key.publickey().export_key().decode('utf-8')
+    private_key_pem = key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.TraditionalOpenSSL,
+        serialization.NoEncryption()
+    ).decode('utf-8')
+    public_key_pem = key.public_key().public_bytes(
+        serialization.Encoding.PEM,
+        serialization.PublicFormat.SubjectPublicKeyInfo
+    ).decode('utf-8')
 
-    return private_key_pem, public_key_pem
+    key_id = register_private_key(key) if register else None
 
+    return private_key_pem, public_key_pem, key_id
 
-def sign_document(document: bytes, private_key_pem: str) -> tuple[str, str]:
+
+def _refill_keys():
+    """
+    Mantém o pool de chaves cheio, gerando novas chaves à medida que são
+    consumidas. Executa em uma thread daemon (ver start_key_pool).
+    """
+    while True:
+        for key_size, pool in _key_pool.items():
+            while not pool.full():
+                pool.put(rsa.generate_private_key(public_exponent=65537, key_size=key_size))
+
+        _key_pool_consumed.wait()
+        _key_pool_consumed.clear()
+
+
+def start_key_pool():
+    """
+    Inicia a thread que pré-gera chaves RSA para generate_rsa_keypair.
+
+    Cada chave do pool é entregue a uma única requisição. O pool vive
+    apenas neste processo e nunca é compartilhado entre processos.
+    Chamadas repetidas não iniciam uma nova thread.
+    """
+    global _key_pool_thread
+
+    with _key_pool_lock:
+        if _key_pool_thread is None:
+            _key_pool_thread = threading.Thread(target=_refill_keys, daemon=True)
+            _key_pool_thread.start()
+
+
+def sign_document(document: bytes | memoryview | None, private_key: str | rsa.RSAPrivateKey,
+                  hash_obj=None) -> tuple[bytes, str]:
     """
     Assina um documento usando RSA com SHA-256.
 
@@ -42,32 +168,135 @@ def sign_document(document: bytes, private_key_pem: str) -> tuple[str, str]:
     2. Assina o hash com a chave privada (PKCS#1 v1.5)
 
     Args:
-        document: Conteúdo do documento em bytes
-        private_key_pem: Chave privada em formato PEM
+        document: Conteúdo do documento (bytes ou memoryview)
+        private_key: Chave privada em formato PEM, ou já carregada
+            (ex.: obtida por get_private_key)
+        hash_obj: Hash SHA-256 já calculado (ex.: por hash_stream); quando
+            fornecido, document é ignorado
 
     Returns:
-        Tupla (signature_base64, hash_hex)
+        Tupla (signature, hash_hex), com a assinatura em bytes
+
+    Raises:
+        ValueError: Se a chave privada não for PEM nem RSAPrivateKey
     """
     # Importar chave privada
-    try:
-        private_key = RSA.import_key(private_key_pem)
-    except ValueError as e:
-        raise ValueError(f"Chave privada inválida: {e}")
+    if isinstance(private_key, str):
+        private_key = _load_private(private_key)
+    elif not isinstance(private_key, rsa.RSAPrivateKey):
+        raise ValueError("Chave privada inválida")
 
     # Calcular hash SHA-256 do documento
-    hash_obj = SHA256.new(document)
+    if hash_obj is None:
+        hash_obj = hashlib.sha256(document)
     hash_hex = hash_obj.hexdigest()
 
     # Assinar o hash com a chave privada (PKCS#1 v1.5)
-    signature = pkcs1_15.new(private_key).sign(hash_obj)
+    # O hash já foi calculado, então é repassado como Prehashed.
+    # A exponenciação modular usa o CRT (p, q, dp, dq, qinv) do OpenSSL,
+    # presentes em toda chave privada carregada de PEM.
+    signature = private_key.sign(
+        hash_obj.digest(), padding.PKCS1v15(), utils.Prehashed(hashes.SHA256())
+    )
+
+    return signature, hash_hex
+
+
+def sign_document_async(document: bytes | memoryview | None,
+                        private_key: str | rsa.RSAPrivateKey, hash_obj=None) -> Future:
+    """
+    Versão assíncrona de sign_document.
+
+    O hash é calculado na thread chamadora e apenas a assinatura RSA é
+    enviada ao pool de threads, de modo que a leitura e o hash de um
+    documento podem se sobrepor à assinatura de outro.
+
+    Returns:
+        Future cujo resultado é a tupla (signature, hash_hex)
+    """
+    if hash_obj is None:
+        hash_obj = hashlib.sha256(document)
+
+    return _rsa_executor.submit(sign_document, None, private_key, hash_obj)
+
+
+def register_private_key(private_key: str | rsa.RSAPrivateKey) -> str:
+    """
+    Registra uma chave privada no servidor.
 
-    # Codificar assinatura em Base64
-    signature_base64 = base64.b64encode(signature).decode('utf-8')
+    A chave é carregada uma única vez e pode ser referenciada pelo key_id
+    retornado, sem que o cliente precise reenviar o PEM. Chaves geradas
+    pelo próprio servidor são registradas já carregadas, sem passar pelo
+    PEM. O registro é limitado às chaves usadas mais recentemente.
 
-    return signature_base64, hash_hex
+    O key_id de uma chave PEM é derivado do próprio PEM (HMAC com um segredo
+    do processo): registrar a mesma chave novamente devolve o mesmo key_id,
+    sem ocupar outra posição do registro. Chaves já carregadas recebem um
+    key_id aleatório.
 
+    O registro existe apenas na memória deste processo: com vários workers
+    (ex.: gunicorn -w N), o key_id só é válido no worker que o criou, o que
+    exige um único worker ou roteamento fixo (sticky) por cliente.
+
+    Args:
+        private_key: Chave privada em formato PEM, ou já carregada
+
+    Returns:
+        key_id associado à chave
+
+    Raises:
+        ValueError: Se a chave for inválida
+    """
+    if isinstance(private_key, str):
+        key_id = hmac.new(
+            _key_id_secret, private_key.encode('utf-8'), hashlib.sha256
+        ).hexdigest()[:32]
+        private_key = _load_private(private_key)
+    elif isinstance(private_key, rsa.RSAPrivateKey):
+        key_id = secrets.token_urlsafe(16)
+    else:
+        raise ValueError("Chave privada inválida: a chave não é RSA")
+
+    with _private_keys_lock:
+        _private_keys[key_id] = private_key
+
+    return key_id
+
+
+def load_private_key(private_key_pem: str) -> rsa.RSAPrivateKey:
+    """
+    Carrega uma chave privada RSA a partir do PEM, sem registrá-la.
+
+    Raises:
+        ValueError: Se a chave for inválida
+    """
+    if not isinstance(private_key_pem, str):
+        raise ValueError("Chave privada inválida")
+
+    return _load_private(private_key_pem)
+
+
+def get_private_key(key_id: str) -> rsa.RSAPrivateKey:
+    """
+    Retorna a chave privada registrada com o key_id informado.
 
-def verify_signature(document: bytes, signature_b64: str, public_key_pem: str) -> dict:
+    Raises:
+        ValueError: Se o key_id for desconhecido ou tiver expirado
+    """
+    if not isinstance(key_id, str):
+        raise ValueError("Chave não encontrada: key_id inválido ou expirado")
+
+    with _private_keys_lock:
+        private_key = _private_keys.get(key_id)
+
+    if private_key is None:
+        raise ValueError("Chave não encontrada: key_id inválido ou expirado")
+
+    return private_key
+
+
+def verify_signature(document: bytes | memoryview | None, signature: bytes, public_key_pem: str,
+                     hash_obj=None) -> dict:
     """
     Verifica a assinatura de um documento.
 
@@ -76,9 +305,11 @@ def verify_signature(document: bytes, signature_b64: str, public_key_pem: str) -
     2. Usa a chave pública para verificar a assinatura
 
     Args:
-        document: Conteúdo do documento em bytes
-        signature_b64: Assinatura em Base64
+        document: Conteúdo do documento (bytes ou memoryview)
+        signature: Assinatura em bytes
         public_key_pem: Chave pública em formato PEM
+        hash_obj: Hash SHA-256 já calculado (ex.: por hash_stream); quando
+            fornecido, document é ignorado
 
     Returns:
         Dict com resultado da verificação:
@@ -86,6 +317,88 @@ def verify_signature(document: bytes, signature_b64: str, public_key_pem: str) -
         - hash_calculated: str (hash do documento atual)
         - reason: str (OK, INTEGRITY_VIOLATION, AUTHENTICITY_FAILURE, INVALID_KEY, INVALID_SIGNATURE)
     """
+    # Calcular hash SHA-256 do documento
+    if hash_obj is None:
+        hash_obj = hashlib.sha256(document)
+
+    return verify_digest(hash_obj.digest(), signature, public_key_pem)
+
+
+def _verify_cache_key(digest: bytes, signature: bytes, public_key_pem: str) -> bytes:
+    """Chave do cache de verificações para (digest, assinatura, chave pública)."""
+    return hashlib.sha256(
+        digest + hashlib.sha256(signature).digest() + public_key_pem.encode('utf-8')
+    ).digest()
+
+
+def verify_digest(digest: bytes, signature: bytes, public_key_pem: str) -> dict:
+    """
+    Verifica uma assinatura a partir do digest SHA-256 do documento.
+
+    Resultados são mantidos em cache por alguns minutos, evitando repetir
+    a operação RSA para a mesma combinação de documento, assinatura e chave.
+
+    Args:
+        digest: Digest SHA-256 do documento
+        signature: Assinatura em bytes
+        public_key_pem: Chave pública em formato PEM
+
+    Returns:
+        Dict com resultado da verificação (mesmo formato de verify_signature)
+    """
+    return verify_many([digest], [signature], [public_key_pem])[0]
+
+
+def verify_many(digests: list[bytes], signatures: list[bytes], public_keys: list[str],
+                executor: Executor | None = None) -> list[dict]:
+    """
+    Verifica várias assinaturas a partir dos digests SHA-256 dos documentos.
+
+    O cache de verificações é consultado e atualizado neste processo; apenas
+    os itens ausentes do cache são verificados, no executor informado. Como
+    só os digests (32 bytes) são enviados, o executor pode ser um pool de
+    processos sem transferir os documentos (ver /api/verify-batch).
+
+    Args:
+        digests: Digests SHA-256 dos documentos
+        signatures: Assinaturas em bytes
+        public_keys: Chaves públicas em formato PEM
+        executor: Executor para as verificações RSA; sem ele (ou com até
+            dois itens a verificar) a verificação é feita em série
+
+    Returns:
+        Lista de dicts com o resultado de cada verificação, na mesma ordem
+    """
+    cache_keys = list(map(_verify_cache_key, digests, signatures, public_keys))
+
+    with _verify_cache_lock:
+        results = [_verify_cache.get(cache_key) for cache_key in cache_keys]
+
+    misses = [index for index, result in enumerate(results) if result is None]
+    miss_args = (
+        [digests[i] for i in misses],
+        [signatures[i] for i in misses],
+        [public_keys[i] for i in misses]
+    )
+
+    # Poucos itens não compensam o custo de comunicação entre processos
+    if executor is None or len(misses) <= 2:
+        verified = map(_verify_digest, *miss_args)
+    else:
+        verified = executor.map(_verify_digest, *miss_args, chunksize=8)
+
+    for index, result in zip(misses, verified):
+        results[index] = result
+        with _verify_cache_lock:
+            _verify_cache[cache_keys[index]] = result
+
+    return [dict(result) for result in results]
+
+
+def _verify_digest(digest: bytes, signature: bytes, public_key_pem: str) -> dict:
+    """
+    Executa a verificação RSA de fato (sem cache), ver verify_digest.
+    """
     result = {
         "valid": False,
         "hash_calculated": "",
@@ -94,28 +407,21 @@ def verify_signature(document: bytes, signature_b64: str, public_key_pem: str) -
 
     # Importar chave pública
     try:
-        public_key = RSA.import_key(public_key_pem)
-    except ValueError as e:
+        public_key = _load_public(public_key_pem)
+    except ValueError:
         result["reason"] = "INVALID_KEY"
         return result
 
-    # Decodificar assinatura de Base64
-    try:
-        signature = base64.b64decode(signature_b64)
-    except Exception:
-        result["reason"] = "INVALID_SIGNATURE"
-        return result
-
-    # Calcular hash SHA-256 do documento
-    hash_obj = SHA256.new(document)
-    result["hash_calculated"] = hash_obj.hexdigest()
+    result["hash_calculated"] = digest.hex()
 
     # Verificar assinatura
     try:
-        pkcs1_15.new(public_key).verify(hash_obj, signature)
+        public_key.verify(
+            signature, digest, padding.PKCS1v15(), utils.Prehashed(hashes.SHA256())
+        )
         result["valid"] = True
         result["reason"] = "OK"
-    except ValueError:
+    except InvalidSignature:
         # A verificação falhou - pode ser integridade ou autenticidade
         # Como não temos como distinguir matematicamente, usamos INTEGRITY_VIOLATION
         # (o documento foi modificado OU a chave está incorreta)
@@ -124,14 +430,68 @@ def verify_signature(document: bytes, signature_b64: str, public_key_pem: str) -
     return result
 
 
-def calculate_hash(document: bytes) -> str:
+def calculate_hash(document: bytes | memoryview) -> str:
     """
     Calcula o hash SHA-256 de um documento.
 
     Args:
-        document: Conteúdo do documento em bytes
+        document: Conteúdo do documento (bytes ou memoryview)
 
     Returns:
         Hash em formato hexadecimal
     """
     return hashlib.sha256(document).hexdigest()
+
+
+def hash_stream(stream: BinaryIO, max_size: int | None = None):
+    """
+    Calcula o hash SHA-256 de um stream, lendo-o em blocos.
+
+    Evita carregar o documento inteiro em memória: cada bloco é
+    repassado ao hash incremental e descartado em seguida.
+
+    Args:
+        stream: Stream binário com o conteúdo do documento
+        max_size: Tamanho máximo aceito em bytes (opcional)
+
+    Returns:
+        Tupla (hash_obj, document_size)
+
+    Raises:
+        ValueError: Se o documento exceder max_size
+    """
+    hash_obj = hashlib.sha256()
+    document_size = 0
+
+    while True:
+        chunk = stream.read(CHUNK_SIZE)
+        if not chunk:
+            break
+
+        document_size += len(chunk)
+        if max_size is not None and document_size > max_size:
+            raise ValueError(f"Documento excede o limite de {max_size // (1024*1024)}MB")
+
+        hash_obj.update(chunk)
+
+    return hash_obj, document_size
+
+
+def hash_many(documents: list[bytes | memoryview]) -> list[bytes]:
+    """
+    Calcula o digest SHA-256 de vários documentos independentes.
+
+    Os hashes são distribuídos entre threads, uma vez que o hashlib libera
+    o GIL durante o cálculo; lotes pequenos (ou máquinas com um único
+    núcleo) são processados em série.
+
+    Args:
+        documents: Lista com o conteúdo dos documentos (bytes ou memoryview)
+
+    Returns:
+        Lista de digests SHA-256, na mesma ordem dos documentos
+    """
+    if len(documents) < HASH_MANY_MIN_BATCH or (os.cpu_count() or 1) < 2:
+        return [hashlib.sha256(document).digest() for document in documents]
+
+    return list(_hash_executor.map(lambda document: hashlib.sha256(document).digest(), documents))
@@ -0,0 +1,6 @@
+"""
+SeguraAssina - Ponto de entrada WSGI
+Uso: WEB_CONCURRENCY=$(nproc) gunicorn -k gthread --threads 4 -b 0.0.0.0:5000 wsgi:app
+"""
+
+from app import app
@@ -12,7 +12,7 @@ const api = axios.create({
 /**
  * Gera par de chaves RSA
  * @param {number} keySize - Tamanho da chave (2048 ou 4096)
- * @returns {Promise<{public_key: string, private_key: string, key_size: number}>}
+ * @returns {Promise<{public_key: string, private_key: string, key_id: string|null, key_size: number}>}
  */
 export async function generateKeys(keySize = 2048) {
   const response = await api.post('/generate-keys', { key_size: keySize });